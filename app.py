@@ -1,143 +1,470 @@
+import logging
+import mimetypes
 import os
 import random
-import requests
-from flask import Flask, jsonify, render_template, request
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import quote
+import orjson
+import httpx
+from flask import Flask, Response, abort, jsonify, redirect, render_template, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from werkzeug.security import safe_join
 
 
-def create_app() -> Flask:
+logger = logging.getLogger(__name__)
+
+
+# Audio file suffixes accepted from mood folders (compared lowercase)
+_MP3_SUFFIXES = frozenset({'.mp3'})
+
+# Cache of mood folder path -> (directory mtime_ns, [relative mp3 paths])
+_dir_scan_cache: dict[str, tuple[int, list[str]]] = {}
+
+# Shared result for missing folders so callers can detect "unchanged" by identity
+_NO_FILES: list[str] = []
+
+
+def scan_mood_folder(music_root: str, mood: str) -> list[str]:
+    """List MP3s in a mood folder, re-scanning only when the folder changed"""
+    mood_folder = os.path.join(music_root, mood)
+    try:
+        st = os.stat(mood_folder)
+        if not stat.S_ISDIR(st.st_mode):
+            raise NotADirectoryError(mood_folder)
+
+        cached = _dir_scan_cache.get(mood_folder)
+        if cached is not None and cached[0] == st.st_mtime_ns:
+            return cached[1]
+
+        with os.scandir(mood_folder) as it:
+            # Store path relative to /static/static_music/
+            files = [
+                f"{mood}/{entry.name}" for entry in it
+                if entry.name[-4:].lower() in _MP3_SUFFIXES
+                and entry.is_file(follow_symlinks=False)
+            ]
+    except OSError:
+        # Missing, not a directory, or removed mid-scan: treat as empty
+        _dir_scan_cache.pop(mood_folder, None)
+        return _NO_FILES
+    _dir_scan_cache[mood_folder] = (st.st_mtime_ns, files)
+    return files
+
+
+# Per-thread RNG so concurrent requests don't share one generator's state
+_tls = threading.local()
+
+
+def _rng() -> random.Random:
+    r = getattr(_tls, 'rng', None)
+    if r is None:
+        r = _tls.rng = random.Random()
+    return r
+
+
+# Mood -> [filenames] from mood-specific folders, filled in by create_app()
+MOOD_TO_FILES: dict[str, list[str]] = {
+    'happy': [],
+    'sad': [],
+    'angry': [],
+    'neutral': [],
+    'surprised': [],
+    'fearful': [],
+    'disgusted': [],
+}
+
+# Provide simple fallbacks if exact mood has no files
+# neutral should have at least one default if present
+FALLBACK_ORDER = ('neutral', 'happy', 'sad', 'angry')
+
+# Mood to Spotify search terms mapping
+MOOD_TO_SPOTIFY_TERMS = {
+    'happy': 'upbeat happy energetic',
+    'sad': 'sad melancholic emotional',
+    'angry': 'intense aggressive powerful',
+    'neutral': 'calm peaceful ambient',
+    'surprised': 'energetic exciting dynamic',
+    'fearful': 'dark atmospheric tense',
+    'disgusted': 'intense dramatic',
+}
+# Search term for moods outside the mapping above
+DEFAULT_SPOTIFY_TERM = 'music'
+
+
+# Mood -> (source mood, files) to serve with fallbacks already applied, plus
+# the fallback entry for unknown moods; rebuilt whenever MOOD_TO_FILES changes
+RESOLVED_FILES: dict[str, tuple[str, list[str]]] = {}
+FALLBACK_FILES: tuple[str, list[str]] = ('', _NO_FILES)
+
+
+def rebuild_resolved_files():
+    """Precompute the fallback lookup so requests need a single dict get"""
+    global RESOLVED_FILES, FALLBACK_FILES
+    fallback: tuple[str, list[str]] = ('', _NO_FILES)
+    for fb in FALLBACK_ORDER:
+        cand = MOOD_TO_FILES.get(fb)
+        if cand:
+            fallback = (fb, cand)
+            break
+    RESOLVED_FILES = {
+        mood: (mood, files) if files else fallback
+        for mood, files in MOOD_TO_FILES.items()
+    }
+    FALLBACK_FILES = fallback
+
+
+def resolve_local_files(mood: str) -> tuple[str, list[str]]:
+    """Source mood and files for a mood, falling back to the first mood that has any"""
+    return RESOLVED_FILES.get(mood, FALLBACK_FILES)
+
+
+# Per-source-mood shuffled deck of the files it was built from, plus the next
+# position; every file plays once per cycle before the deck is reshuffled.
+# Decks are keyed by the mood that owns the files, so arbitrary URL moods
+# falling back to the same folder share one deck.
+MOOD_DECKS: dict[str, tuple[list[str], list[str]]] = {}
+DECK_IDX: dict[str, int] = {}
+_deck_lock = threading.Lock()
+
+
+def next_file_for_mood(source: str, files: list[str]) -> str:
+    """Deal the next file from the source mood's deck, avoiding repeats"""
+    with _deck_lock:
+        entry = MOOD_DECKS.get(source)
+        if entry is None or entry[0] is not files:
+            # Folder contents changed (or first request): start a new deck
+            entry = (files, _rng().sample(files, len(files)))
+            MOOD_DECKS[source] = entry
+            DECK_IDX[source] = 0
+        deck = entry[1]
+        i = DECK_IDX.get(source, 0)
+        if i >= len(deck):
+            last = deck[-1]
+            deck = _rng().sample(files, len(files))
+            # Don't let the new cycle open with the song that just played
+            if len(deck) > 1 and deck[0] == last:
+                deck[0], deck[-1] = deck[-1], deck[0]
+            MOOD_DECKS[source] = (files, deck)
+            i = 0
+        DECK_IDX[source] = i + 1
+        return deck[i]
+
+
+# Spotify retry policy: transient statuses and connection errors are retried,
+# but a Retry-After longer than a request is willing to wait gives up instead
+SPOTIFY_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+SPOTIFY_MAX_RETRIES = 2
+SPOTIFY_MAX_RETRY_DELAY = 2.5
+
+# Spotify lookups run on each app's thread pool and a request waits at most
+# SPOTIFY_LOOKUP_TIMEOUT for one. SPOTIFY_SLOTS bounds running plus queued
+# lookups; past it Spotify is skipped rather than queued
+SPOTIFY_LOOKUP_WORKERS = 8
+SPOTIFY_LOOKUP_TIMEOUT = 2.5
+SPOTIFY_SLOTS = threading.BoundedSemaphore(16)
+
+
+def send_with_retries(client: httpx.Client, method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a request, retrying 429s (per Retry-After), 5xx and transport errors"""
+    for attempt in range(SPOTIFY_MAX_RETRIES + 1):
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == SPOTIFY_MAX_RETRIES:
+                raise
+            delay = 0.3 * 2 ** attempt
+            logger.debug("Spotify request failed (%s), retrying in %ss", e, delay)
+            time.sleep(delay)
+            continue
+        if response.status_code not in SPOTIFY_RETRY_STATUSES or attempt == SPOTIFY_MAX_RETRIES:
+            return response
+        retry_after = response.headers.get('Retry-After', '')
+        delay = int(retry_after) if retry_after.isdigit() else 0.3 * 2 ** attempt
+        if delay > SPOTIFY_MAX_RETRY_DELAY:
+            logger.warning("Spotify asked to retry after %ss, giving up", delay)
+            return response
+        logger.debug("Spotify returned %s, retrying in %ss", response.status_code, delay)
+        time.sleep(delay)
+    return response
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for faster jsonify()"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        # Honour the sort_keys/indent settings the stdlib provider would use
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def create_app(spotify_transport: httpx.BaseTransport | None = None) -> Flask:
     app = Flask(
         __name__,
         static_folder=os.path.join('static'),
         template_folder=os.path.join('templates'),
     )
+    app.json = OrjsonProvider(app)
     CORS(app)
 
     # Map moods to available songs in /static/static_music/{mood}/ folders
     music_root = os.path.join(app.static_folder, 'static_music')
 
-    # Build a dictionary of mood -> [filenames] from mood-specific folders
-    mood_to_files = {
-        'happy': [],
-        'sad': [],
-        'angry': [],
-        'neutral': [],
-        'surprised': [],
-        'fearful': [],
-        'disgusted': [],
-    }
+    # Hand audio streaming to the front-end server so MP3 bytes never pass
+    # through Python: USE_X_SENDFILE=true for Apache/lighttpd, or
+    # X_ACCEL_MUSIC_LOCATION=/_music/ for an nginx internal location
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    accel_music_location = os.environ.get('X_ACCEL_MUSIC_LOCATION', '')
+
+    if accel_music_location:
+        @app.get('/static/static_music/<path:filename>')
+        def music_file(filename: str):
+            if safe_join(music_root, filename) is None:
+                abort(404)
+            # nginx keeps this Content-Type when it serves the internal location
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = Response(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = accel_music_location.rstrip('/') + '/' + quote(filename)
+            return response
 
-    # Auto-discover files in mood-specific folders
-    for mood in mood_to_files.keys():
-        mood_folder = os.path.join(music_root, mood)
-        if os.path.isdir(mood_folder):
-            for filename in os.listdir(mood_folder):
-                if filename.lower().endswith('.mp3'):
-                    # Store path relative to /static/static_music/
-                    mood_to_files[mood].append(f"{mood}/{filename}")
+    # /static URL per discovered file and the serialized /api/status body;
+    # both are rebuilt only when a mood folder's contents change
+    static_paths: dict[str, str] = {}
+    status_body: bytes | None = None
 
-    # Provide simple fallbacks if exact mood has no files
-    # neutral should have at least one default if present
-    fallback_order = ['neutral', 'happy', 'sad', 'angry']
+    def refresh_mood_files(pool: ThreadPoolExecutor | None = None):
+        """Auto-discover files in mood-specific folders"""
+        nonlocal static_paths, status_body
+        moods = list(MOOD_TO_FILES)
+        if pool is None:
+            scanned = [scan_mood_folder(music_root, mood) for mood in moods]
+        else:
+            scanned = pool.map(lambda mood: scan_mood_folder(music_root, mood), moods)
+        changed = False
+        for mood, files in zip(moods, scanned):
+            if files is not MOOD_TO_FILES[mood]:
+                MOOD_TO_FILES[mood] = files
+                changed = True
+        if changed:
+            rebuild_resolved_files()
+            static_paths = {
+                f: f"/static/static_music/{f}"
+                for files in MOOD_TO_FILES.values() for f in files
+            }
+            status_body = None
 
-    # Track last served filename per mood to avoid immediate repeats
-    last_served_for_mood: dict[str, str | None] = {m: None for m in mood_to_files}
+    # Cold start: scan all mood folders concurrently (scandir releases the GIL)
+    # so startup waits on the slowest folder rather than the sum of them
+    with ThreadPoolExecutor(max_workers=len(MOOD_TO_FILES)) as pool:
+        refresh_mood_files(pool)
 
     # Spotify API configuration
     SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', '')
     SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', '')
     USE_SPOTIFY = bool(SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET)
 
-    # Mood to Spotify search terms mapping
-    mood_to_spotify_terms = {
-        'happy': 'upbeat happy energetic',
-        'sad': 'sad melancholic emotional',
-        'angry': 'intense aggressive powerful',
-        'neutral': 'calm peaceful ambient',
-        'surprised': 'energetic exciting dynamic',
-        'fearful': 'dark atmospheric tense',
-        'disgusted': 'intense dramatic',
-    }
+    # Shared HTTP/2 client: concurrent Spotify calls to the same host are
+    # multiplexed over one keep-alive TLS connection (tests pass a mock transport)
+    http_client = httpx.Client(
+        http2=True,
+        timeout=10,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+        transport=spotify_transport,
+    )
+
+    def spotify_request(method: str, url: str, **kwargs) -> httpx.Response:
+        return send_with_retries(http_client, method, url, **kwargs)
+
+    # Cache the client-credentials token until shortly before it expires
+    _token_cache = {'token': None, 'expires_at': 0.0}
+    _token_lock = threading.Lock()
 
     def get_spotify_token():
         """Get Spotify access token using Client Credentials flow"""
         if not USE_SPOTIFY:
             return None
+        if time.monotonic() < _token_cache['expires_at'] - 60:
+            return _token_cache['token']
+        with _token_lock:
+            # Another thread may have refreshed the token while we waited
+            if time.monotonic() < _token_cache['expires_at'] - 60:
+                return _token_cache['token']
+            return _fetch_spotify_token()
+
+    def _fetch_spotify_token():
         try:
             auth_url = 'https://accounts.spotify.com/api/token'
-            auth_response = requests.post(
+            auth_response = spotify_request(
+                'POST',
                 auth_url,
-                {
+                data={
                     'grant_type': 'client_credentials',
                     'client_id': SPOTIFY_CLIENT_ID,
                     'client_secret': SPOTIFY_CLIENT_SECRET,
                 },
-                headers={'Content-Type': 'application/x-www-form-urlencoded'}
+                headers={'Content-Type': 'application/x-www-form-urlencoded'},
             )
             if auth_response.status_code == 200:
-                return auth_response.json().get('access_token')
+                data = auth_response.json()
+                token = data.get('access_token')
+                if token:
+                    _token_cache['token'] = token
+                    _token_cache['expires_at'] = time.monotonic() + data.get('expires_in', 3600)
+                return token
         except Exception as e:
-            print(f"Spotify token error: {e}")
+            logger.warning("Spotify token error: %s", e)
         return None
 
+    # Cache built track dicts per search term (unknown moods all share the
+    # default term); only the random pick runs on a hit. With pre-warming on,
+    # a background thread re-fetches every term before entries expire, so the
+    # TTL is stretched past the refresh interval.
+    SPOTIFY_PREFETCH = USE_SPOTIFY and os.environ.get('SPOTIFY_PREFETCH', 'false').lower() == 'true'
+    SEARCH_REFRESH_INTERVAL = 600
+    SEARCH_CACHE_TTL = 900 if SPOTIFY_PREFETCH else 300
+    _search_cache: dict[str, tuple[float, list[dict]]] = {}
+    # One lock per search term so a cold fetch only blocks requests for that term
+    _search_locks: dict[str, threading.Lock] = {}
+
+    def _build_track_dict(track: dict) -> dict:
+        """Reduce a Spotify track object to the fields the API returns"""
+        return {
+            'name': track['name'],
+            'artist': ', '.join([a['name'] for a in track['artists']]),
+            'preview_url': track.get('preview_url'),
+            'external_url': track['external_urls'].get('spotify'),
+            'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None
+        }
+
+    def _fetch_spotify_tracks(search_term: str, token: str):
+        """Fetch candidate tracks for a search term, preferring those with preview URLs"""
+        logger.debug("Searching Spotify with term: %s", search_term)
+        search_url = 'https://api.spotify.com/v1/search'
+        headers = {'Authorization': f'Bearer {token}'}
+        params = {
+            'q': search_term,
+            'type': 'track',
+            'limit': 50,  # Get more results for better selection
+            'market': 'US'  # US market for better song availability
+        }
+        response = spotify_request('GET', search_url, headers=headers, params=params)
+        logger.debug("Spotify API response status: %s", response.status_code)
+
+        if response.status_code != 200:
+            logger.warning("Spotify API error: %s - %s", response.status_code, response.text)
+            return None
+
+        tracks = response.json().get('tracks', {}).get('items', [])
+        logger.debug("Found %d tracks", len(tracks))
+        if not tracks:
+            logger.debug("No tracks found in Spotify response")
+            return None
+
+        # Prioritize tracks with preview URLs
+        tracks_with_preview = [t for t in tracks if t.get('preview_url')]
+
+        # Use tracks with preview URLs first, then all tracks
+        if tracks_with_preview:
+            logger.debug("Using %d tracks with preview URLs", len(tracks_with_preview))
+            return tracks_with_preview
+        logger.debug("Using %d tracks (some may not have preview)", len(tracks))
+        return tracks
+
+    def _store_spotify_tracks(search_term: str, tracks):
+        """Cache fetched tracks for a search term and return the new cache entry"""
+        if not tracks:
+            return None
+        # Build the response dicts once per fetch, not per request
+        cached = (time.monotonic(), [_build_track_dict(t) for t in tracks])
+        _search_cache[search_term] = cached
+        return cached
+
     def search_spotify_track(mood: str, token: str):
         """Search for a track on Spotify based on mood"""
         if not token:
-            print("No Spotify token available")
+            logger.debug("No Spotify token available")
             return None
+        # Get mood-specific search term
+        search_term = MOOD_TO_SPOTIFY_TERMS.get(mood, DEFAULT_SPOTIFY_TERM)
         try:
-            # Get mood-specific search term
-            search_term = mood_to_spotify_terms.get(mood, 'music')
-            print(f"Searching Spotify for mood '{mood}' with term: {search_term}")
-            search_url = 'https://api.spotify.com/v1/search'
-            headers = {'Authorization': f'Bearer {token}'}
-            params = {
-                'q': search_term,
-                'type': 'track',
-                'limit': 50,  # Get more results for better selection
-                'market': 'US'  # US market for better song availability
-            }
-            response = requests.get(search_url, headers=headers, params=params, timeout=10)
-            print(f"Spotify API response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                tracks = response.json().get('tracks', {}).get('items', [])
-                print(f"Found {len(tracks)} tracks")
-                
-                if tracks:
-                    # Prioritize tracks with preview URLs
-                    tracks_with_preview = [t for t in tracks if t.get('preview_url')]
-                    
-                    # Use tracks with preview URLs first, then all tracks
-                    if tracks_with_preview:
-                        tracks_to_use = tracks_with_preview
-                        print(f"Using {len(tracks_with_preview)} tracks with preview URLs")
-                    else:
-                        tracks_to_use = tracks
-                        print(f"Using {len(tracks_to_use)} tracks (some may not have preview)")
-                    
-                    # Select a random track
-                    track = random.choice(tracks_to_use)
-                    
-                    result = {
-                        'name': track['name'],
-                        'artist': ', '.join([a['name'] for a in track['artists']]),
-                        'preview_url': track.get('preview_url'),
-                        'external_url': track['external_urls'].get('spotify'),
-                        'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None
-                    }
-                    print(f"Selected track: {result['name']} by {result['artist']}, preview_url: {result['preview_url'] is not None}")
-                    return result
-                else:
-                    print("No tracks found in Spotify response")
-            else:
-                print(f"Spotify API error: {response.status_code} - {response.text}")
+            cached = _search_cache.get(search_term)
+            if cached is None or time.monotonic() - cached[0] >= SEARCH_CACHE_TTL:
+                with _search_locks.setdefault(search_term, threading.Lock()):
+                    cached = _search_cache.get(search_term)
+                    if cached is None or time.monotonic() - cached[0] >= SEARCH_CACHE_TTL:
+                        cached = _store_spotify_tracks(search_term, _fetch_spotify_tracks(search_term, token))
+                        if cached is None:
+                            return None
+
+            # Select a random track
+            result = _rng().choice(cached[1])
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Selected track: %s by %s, preview_url: %s",
+                             result['name'], result['artist'], result['preview_url'] is not None)
+            return result
         except Exception as e:
-            print(f"Spotify search error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Spotify search error: %s", e)
         return None
 
+    # Spotify lookups run in the background while local files are resolved
+    executor = ThreadPoolExecutor(max_workers=SPOTIFY_LOOKUP_WORKERS)
+
+    def spotify_lookup(mood: str):
+        """Fetch a token and search for a track in one step"""
+        token = get_spotify_token()
+        if not token:
+            logger.info("Failed to get Spotify token, falling back to local files")
+            return None
+        logger.debug("Got Spotify token, searching for track...")
+        return search_spotify_track(mood, token)
+
+    def refresh_spotify_cache():
+        """Fetch search results for every mood's term in parallel"""
+        token = get_spotify_token()
+        if not token:
+            return
+
+        def prefetch(search_term: str):
+            try:
+                _store_spotify_tracks(search_term, _fetch_spotify_tracks(search_term, token))
+            except Exception as e:
+                logger.warning("Spotify prefetch error for term %r: %s", search_term, e)
+
+        with ThreadPoolExecutor(max_workers=len(MOOD_TO_SPOTIFY_TERMS)) as pool:
+            list(pool.map(prefetch, MOOD_TO_SPOTIFY_TERMS.values()))
+
+    def spotify_refresh_loop():
+        while True:
+            refresh_spotify_cache()
+            time.sleep(SEARCH_REFRESH_INTERVAL)
+
+    # Keep the search cache warm so user requests never wait on Spotify.
+    # Opt-in, and started on the first request rather than at import so the
+    # Werkzeug reloader parent (which never serves requests) doesn't run it.
+    refresh_started = False
+    refresh_start_lock = threading.Lock()
+
+    if SPOTIFY_PREFETCH:
+        @app.before_request
+        def start_spotify_refresh():
+            nonlocal refresh_started
+            if refresh_started:
+                return
+            with refresh_start_lock:
+                if not refresh_started:
+                    threading.Thread(target=spotify_refresh_loop, name='spotify-cache-refresh', daemon=True).start()
+                    refresh_started = True
+
     @app.route('/')
     def index():
         return render_template('index.html')
@@ -145,116 +472,118 @@ def create_app() -> Flask:
     @app.get('/api/status')
     def get_status():
         """Get API status and configuration"""
-        return jsonify({
-            'spotify_configured': USE_SPOTIFY,
-            'spotify_client_id_set': bool(SPOTIFY_CLIENT_ID),
-            'local_files_available': sum(len(files) for files in mood_to_files.values()) > 0,
-            'mood_files': {mood: len(files) for mood, files in mood_to_files.items()}
-        })
+        nonlocal status_body
+        refresh_mood_files()
+        if status_body is None:
+            status_body = orjson.dumps({
+                'spotify_configured': USE_SPOTIFY,
+                'spotify_client_id_set': bool(SPOTIFY_CLIENT_ID),
+                'local_files_available': sum(len(files) for files in MOOD_TO_FILES.values()) > 0,
+                'mood_files': {mood: len(files) for mood, files in MOOD_TO_FILES.items()}
+            }, option=orjson.OPT_SORT_KEYS)
+        return Response(status_body, mimetype='application/json')
 
-    @app.get('/api/song/<mood>')
-    def get_song_for_mood(mood: str):
-        mood = mood.lower()
-        use_spotify = request.args.get('spotify', 'false').lower() == 'true'
-        
-        print(f"Request for mood: {mood}, use_spotify: {use_spotify}, USE_SPOTIFY: {USE_SPOTIFY}")
-        
-        # Try Spotify first if enabled and requested
-        spotify_failed = False
-        if use_spotify:
-            if not USE_SPOTIFY:
-                print("Spotify requested but credentials not configured, falling back to local files")
-                spotify_failed = True
-            else:
-                token = get_spotify_token()
-                if token:
-                    print("Got Spotify token, searching for track...")
-                    spotify_track = search_spotify_track(mood, token)
-                    if spotify_track:
-                        if spotify_track.get('preview_url'):
-                            print(f"Returning Spotify track with preview: {spotify_track['name']}")
-                            return jsonify({
-                                'ok': True,
-                                'source': 'spotify',
-                                'mood': mood,
-                                'name': spotify_track['name'],
-                                'artist': spotify_track['artist'],
-                                'preview_url': spotify_track['preview_url'],
-                                'external_url': spotify_track['external_url'],
-                                'album_image': spotify_track['album_image']
-                            })
-                        else:
-                            print(f"Spotify track found but no preview URL: {spotify_track['name']}")
-                            # Still try local files if no preview
-                            spotify_failed = True
-                    else:
-                        print("No Spotify track found, falling back to local files")
-                        spotify_failed = True
-                else:
-                    print("Failed to get Spotify token, falling back to local files")
-                    spotify_failed = True
-        
-        # Fallback to local files (always try this)
-        print(f"Trying local files for mood: {mood}")
-        
-        # Fallback to local files
-        files = mood_to_files.get(mood, [])
-        if not files:
-            # Search fallbacks
-            for fb in fallback_order:
-                if mood_to_files.get(fb):
-                    files = mood_to_files[fb]
-                    break
+    def try_spotify(mood: str):
+        """Spotify response for a mood, or None if no previewable track"""
+        slots = SPOTIFY_SLOTS
+        if not slots.acquire(blocking=False):
+            logger.info("Spotify lookups saturated, falling back to local files")
+            return None
+        spotify_future = executor.submit(spotify_lookup, mood)
+        spotify_future.add_done_callback(lambda _: slots.release())
+        try:
+            spotify_track = spotify_future.result(timeout=SPOTIFY_LOOKUP_TIMEOUT)
+        except FutureTimeoutError:
+            # Drop the lookup if it hasn't started; a running one still fills the cache
+            spotify_future.cancel()
+            logger.info("Spotify lookup timed out, falling back to local files")
+            return None
+        if not spotify_track:
+            logger.debug("No Spotify track found, falling back to local files")
+            return None
+        if not spotify_track.get('preview_url'):
+            logger.debug("Spotify track found but no preview URL: %s", spotify_track['name'])
+            return None
+        logger.debug("Returning Spotify track with preview: %s", spotify_track['name'])
+        return {
+            'ok': True,
+            'source': 'spotify',
+            'mood': mood,
+            'name': spotify_track['name'],
+            'artist': spotify_track['artist'],
+            'preview_url': spotify_track['preview_url'],
+            'external_url': spotify_track['external_url'],
+            'album_image': spotify_track['album_image']
+        }
 
+    def try_local(mood: str):
+        """Local file response for a mood, or None if no files are available"""
+        logger.debug("Trying local files for mood: %s", mood)
+        source, files = resolve_local_files(mood)
         if not files:
-            # Try Spotify as fallback if local files not available
-            if USE_SPOTIFY and not use_spotify:
-                print("No local files, trying Spotify as fallback...")
-                token = get_spotify_token()
-                if token:
-                    spotify_track = search_spotify_track(mood, token)
-                    if spotify_track and spotify_track.get('preview_url'):
-                        return jsonify({
-                            'ok': True,
-                            'source': 'spotify',
-                            'mood': mood,
-                            'name': spotify_track['name'],
-                            'artist': spotify_track['artist'],
-                            'preview_url': spotify_track['preview_url'],
-                            'external_url': spotify_track['external_url'],
-                            'album_image': spotify_track['album_image']
-                        })
-            
-            # No files at all; return helpful message
-            message = 'No music files found for this mood. '
-            if USE_SPOTIFY:
-                message += 'Spotify is configured but no preview available. '
-            message += 'Add MP3s in /static/static_music/{mood}/ folders or configure Spotify API with preview URLs.'
-            return jsonify({
-                'ok': False,
-                'message': message
-            }), 404
+            return None
 
         # Avoid immediate repeat per mood if possible
-        chosen = None
-        if len(files) == 1:
-            chosen = files[0]
-        else:
-            previous = last_served_for_mood.get(mood)
-            candidates = [f for f in files if f != previous]
-            chosen = random.choice(candidates) if candidates else random.choice(files)
-
-        last_served_for_mood[mood] = chosen
+        chosen = next_file_for_mood(source, files)
 
         # Return path relative to /static
-        static_path = f"/static/static_music/{chosen}"
-        return jsonify({
+        # A folder refresh may have dropped the file since it was picked
+        static_path = static_paths.get(chosen) or f"/static/static_music/{chosen}"
+        return {
             'ok': True,
             'source': 'local',
             'path': static_path,
             'mood': mood,
             'file': chosen
-        })
+        }
+
+    @app.get('/api/song/<mood>')
+    def get_song_for_mood(mood: str):
+        mood = mood.lower()
+        use_spotify = request.args.get('spotify', 'false').lower() == 'true'
+
+        logger.debug("Request for mood: %s, use_spotify: %s, USE_SPOTIFY: %s", mood, use_spotify, USE_SPOTIFY)
+
+        # Spotify first if requested, otherwise only as a fallback for local files
+        if not USE_SPOTIFY:
+            if use_spotify:
+                logger.debug("Spotify requested but credentials not configured, falling back to local files")
+            strategies = (try_local,)
+        elif use_spotify:
+            strategies = (try_spotify, try_local)
+        else:
+            strategies = (try_local, try_spotify)
+
+        for strategy in strategies:
+            result = strategy(mood)
+            if result is not None:
+                return jsonify(result)
+
+        # No files at all; return helpful message
+        message = 'No music files found for this mood. '
+        if USE_SPOTIFY:
+            message += 'Spotify is configured but no preview available. '
+        message += 'Add MP3s in /static/static_music/{mood}/ folders or configure Spotify API with preview URLs.'
+        return jsonify({
+            'ok': False,
+            'message': message
+        }), 404
+
+    @app.get('/api/play/<mood>')
+    def play_song_for_mood(mood: str):
+        """Redirect straight to a local song so players can use this as a src"""
+        result = try_local(mood.lower())
+        if result is None:
+            return jsonify({
+                'ok': False,
+                'message': 'No music files found for this mood. Add MP3s in /static/static_music/{mood}/ folders.'
+            }), 404
+
+        # Escape the filename so characters like '#' or '?' stay part of the path
+        response = redirect(f"/static/static_music/{quote(result['file'])}", code=302)
+        # Each hit must pick a new song, so never cache the redirect itself
+        response.headers['Cache-Control'] = 'no-store'
+        return response
 
     return app
 
@@ -263,6 +592,8 @@ app = create_app()
 
 
 if __name__ == '__main__':
+    # Set LOG_LEVEL=DEBUG to trace mood/Spotify decisions per request
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
     # Ensure the server runs on a friendly host/port
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
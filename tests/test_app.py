@@ -0,0 +1,354 @@
+import threading
+import time
+
+import httpx
+import orjson
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def mood_files(monkeypatch):
+    """Replace the discovered mood folders, restoring the real table afterwards"""
+    def set_files(**files):
+        for mood in app_module.MOOD_TO_FILES:
+            monkeypatch.setitem(app_module.MOOD_TO_FILES, mood, files.get(mood, app_module._NO_FILES))
+        app_module.rebuild_resolved_files()
+
+    yield set_files
+    monkeypatch.undo()
+    app_module.rebuild_resolved_files()
+
+
+def test_deck_never_repeats_across_reshuffles():
+    files = ['happy/a.mp3', 'happy/b.mp3', 'happy/c.mp3', 'happy/d.mp3']
+    dealt = [app_module.next_file_for_mood('test-deck', files) for _ in range(40)]
+
+    assert all(a != b for a, b in zip(dealt, dealt[1:]))
+    # Every cycle plays each file exactly once
+    for start in range(0, len(dealt), len(files)):
+        assert sorted(dealt[start:start + len(files)]) == files
+
+
+def test_deck_restarts_when_files_change():
+    app_module.next_file_for_mood('test-restart', ['sad/a.mp3', 'sad/b.mp3'])
+    assert app_module.next_file_for_mood('test-restart', ['sad/c.mp3']) == 'sad/c.mp3'
+
+
+def test_play_redirects_to_escaped_song(mood_files):
+    client = app_module.create_app().test_client()
+    mood_files(happy=['happy/a b#1?.mp3'])
+
+    response = client.get('/api/play/happy')
+
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/static/static_music/happy/a%20b%231%3F.mp3'
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_play_without_files_is_404(mood_files):
+    client = app_module.create_app().test_client()
+    mood_files()
+
+    response = client.get('/api/play/happy')
+
+    assert response.status_code == 404
+    assert response.json['ok'] is False
+    assert 'No music files found' in response.json['message']
+
+
+def test_empty_mood_falls_back_in_order(mood_files):
+    happy, sad = ['happy/a.mp3'], ['sad/a.mp3']
+    mood_files(happy=happy, sad=sad)
+
+    assert app_module.resolve_local_files('angry') == ('happy', happy)
+    assert app_module.resolve_local_files('sad') == ('sad', sad)
+
+
+def test_unknown_mood_uses_fallback(mood_files):
+    neutral = ['neutral/a.mp3']
+    mood_files(neutral=neutral)
+
+    assert app_module.resolve_local_files('contempt') == ('neutral', neutral)
+
+
+def test_no_files_anywhere(mood_files):
+    mood_files()
+
+    source, files = app_module.resolve_local_files('happy')
+    assert not files
+
+
+def test_scan_mood_folder_reuses_unchanged_results(tmp_path):
+    root = str(tmp_path)
+    assert app_module.scan_mood_folder(root, 'happy') is app_module.scan_mood_folder(root, 'happy')
+
+    (tmp_path / 'happy').mkdir()
+    (tmp_path / 'happy' / 'song.MP3').write_bytes(b'')
+    (tmp_path / 'happy' / 'notes.txt').write_bytes(b'')
+    first = app_module.scan_mood_folder(root, 'happy')
+    assert first == ['happy/song.MP3']
+    assert app_module.scan_mood_folder(root, 'happy') is first
+
+
+def test_scan_mood_folder_ignores_file_in_place_of_folder(tmp_path):
+    (tmp_path / 'sad').write_bytes(b'')
+
+    assert app_module.scan_mood_folder(str(tmp_path), 'sad') is app_module._NO_FILES
+
+
+def test_status_body_is_serialized_once(monkeypatch):
+    calls = []
+    real_dumps = orjson.dumps
+
+    def counting_dumps(*args, **kwargs):
+        calls.append(args)
+        return real_dumps(*args, **kwargs)
+
+    client = app_module.create_app().test_client()
+    monkeypatch.setattr(app_module.orjson, 'dumps', counting_dumps)
+    bodies = {client.get('/api/status').data for _ in range(5)}
+
+    assert len(calls) == 1
+    assert len(bodies) == 1
+
+
+def _client(*responses):
+    """httpx client replaying the given responses (or exceptions) in order"""
+    queue = list(responses)
+
+    def handler(request):
+        item = queue.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(app_module.time, 'sleep', recorded.append)
+    return recorded
+
+
+def test_retry_honours_retry_after(sleeps):
+    client = _client(
+        httpx.Response(429, headers={'Retry-After': '1'}),
+        httpx.Response(200, json={'ok': True}),
+    )
+    response = app_module.send_with_retries(client, 'GET', 'https://api.spotify.com/v1/search')
+
+    assert response.status_code == 200
+    assert sleeps == [1]
+
+
+def test_retry_gives_up_on_long_retry_after(sleeps):
+    client = _client(httpx.Response(429, headers={'Retry-After': '120'}))
+    response = app_module.send_with_retries(client, 'GET', 'https://api.spotify.com/v1/search')
+
+    assert response.status_code == 429
+    assert sleeps == []
+
+
+def test_retry_stops_after_max_retries(sleeps):
+    client = _client(*[httpx.Response(503) for _ in range(app_module.SPOTIFY_MAX_RETRIES + 1)])
+    response = app_module.send_with_retries(client, 'GET', 'https://api.spotify.com/v1/search')
+
+    assert response.status_code == 503
+    assert len(sleeps) == app_module.SPOTIFY_MAX_RETRIES
+
+
+def test_retry_on_transport_error(sleeps):
+    client = _client(httpx.ConnectError('boom'), httpx.Response(200))
+    response = app_module.send_with_retries(client, 'GET', 'https://api.spotify.com/v1/search')
+
+    assert response.status_code == 200
+    assert len(sleeps) == 1
+
+
+def test_transport_error_raised_when_retries_exhausted(sleeps):
+    client = _client(*[httpx.ConnectError('boom') for _ in range(app_module.SPOTIFY_MAX_RETRIES + 1)])
+    with pytest.raises(httpx.ConnectError):
+        app_module.send_with_retries(client, 'GET', 'https://api.spotify.com/v1/search')
+
+
+class FakeSpotify:
+    """MockTransport handler standing in for the token and search endpoints"""
+
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.token_calls = 0
+        self.search_terms = []
+        # Cleared to hold search responses until the test sets it again
+        self.search_gate = threading.Event()
+        self.search_gate.set()
+
+    def __call__(self, request):
+        if request.url.host == 'accounts.spotify.com':
+            self.token_calls += 1
+            return httpx.Response(200, json={
+                'access_token': f'token-{self.token_calls}',
+                'expires_in': self.expires_in,
+            })
+        self.search_gate.wait(5)
+        self.search_terms.append(request.url.params['q'])
+        return httpx.Response(200, json={'tracks': {'items': [{
+            'name': 'Song',
+            'artists': [{'name': 'Artist'}],
+            'preview_url': 'https://p.scdn.co/mp3-preview/1',
+            'external_urls': {'spotify': 'https://open.spotify.com/track/1'},
+            'album': {'images': []},
+        }]}})
+
+
+@pytest.fixture
+def spotify(monkeypatch):
+    """App with Spotify configured against a FakeSpotify transport"""
+    monkeypatch.setenv('SPOTIFY_CLIENT_ID', 'id')
+    monkeypatch.setenv('SPOTIFY_CLIENT_SECRET', 'secret')
+    fake = FakeSpotify()
+    fake.client = app_module.create_app(spotify_transport=httpx.MockTransport(fake)).test_client()
+    return fake
+
+
+def test_token_is_reused_until_near_expiry(spotify, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app_module.time, 'monotonic', lambda: now[0])
+
+    for _ in range(3):
+        assert spotify.client.get('/api/song/happy?spotify=true').json['source'] == 'spotify'
+    assert spotify.token_calls == 1
+
+    now[0] += spotify.expires_in - 61
+    spotify.client.get('/api/song/happy?spotify=true')
+    assert spotify.token_calls == 1
+
+    # Within the 60s safety margin before expires_in the token is refreshed
+    now[0] += 2
+    spotify.client.get('/api/song/happy?spotify=true')
+    assert spotify.token_calls == 2
+
+
+def test_search_is_cached_per_term(spotify):
+    for mood in ('happy', 'happy', 'sad', 'happy', 'x1', 'x2', 'x1', 'whatever'):
+        assert spotify.client.get(f'/api/song/{mood}?spotify=true').json['source'] == 'spotify'
+
+    # Unknown moods all share the default term's single cache entry
+    assert spotify.search_terms == [
+        app_module.MOOD_TO_SPOTIFY_TERMS['happy'],
+        app_module.MOOD_TO_SPOTIFY_TERMS['sad'],
+        app_module.DEFAULT_SPOTIFY_TERM,
+    ]
+
+
+def _free_slots(slots, expected, timeout=2.0):
+    """Count acquirable slots, waiting briefly for in-flight lookups to finish"""
+    deadline = time.monotonic() + timeout
+    while True:
+        acquired = 0
+        while acquired < expected and slots.acquire(blocking=False):
+            acquired += 1
+        for _ in range(acquired):
+            slots.release()
+        if acquired == expected or time.monotonic() > deadline:
+            return acquired
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def slots(monkeypatch):
+    semaphore = threading.BoundedSemaphore(4)
+    monkeypatch.setattr(app_module, 'SPOTIFY_SLOTS', semaphore)
+    monkeypatch.setattr(app_module, 'SPOTIFY_LOOKUP_TIMEOUT', 0.05)
+    return semaphore
+
+
+def test_completed_lookup_releases_its_slot(spotify, slots):
+    assert spotify.client.get('/api/song/happy?spotify=true').json['source'] == 'spotify'
+    assert _free_slots(slots, 4) == 4
+
+
+def test_slow_lookup_falls_back_to_local(spotify, slots, mood_files):
+    mood_files(sad=['sad/a.mp3'])
+    spotify.search_gate.clear()
+
+    response = spotify.client.get('/api/song/sad?spotify=true')
+    assert response.json['source'] == 'local'
+    assert response.json['file'] == 'sad/a.mp3'
+
+    # The abandoned lookup keeps its slot until it finishes, then frees it
+    assert _free_slots(slots, 4, timeout=0) == 3
+    spotify.search_gate.set()
+    assert _free_slots(slots, 4) == 4
+
+
+def test_cancelled_lookup_releases_its_slot(spotify, slots, mood_files, monkeypatch):
+    monkeypatch.setattr(app_module, 'SPOTIFY_LOOKUP_WORKERS', 1)
+    client = app_module.create_app(spotify_transport=httpx.MockTransport(spotify)).test_client()
+    mood_files(happy=['happy/a.mp3'], sad=['sad/a.mp3'])
+    spotify.search_gate.clear()
+
+    # The first lookup occupies the only worker; the second is still queued
+    # when it times out, so it is cancelled and its slot freed right away
+    assert client.get('/api/song/happy?spotify=true').json['source'] == 'local'
+    assert client.get('/api/song/sad?spotify=true').json['source'] == 'local'
+    assert _free_slots(slots, 4, timeout=0) == 3
+
+    spotify.search_gate.set()
+    assert _free_slots(slots, 4) == 4
+    assert spotify.search_terms == [app_module.MOOD_TO_SPOTIFY_TERMS['happy']]
+
+
+def test_saturated_lookups_skip_spotify(spotify, slots, mood_files):
+    mood_files(happy=['happy/a.mp3'])
+    for _ in range(4):
+        slots.acquire()
+    try:
+        assert spotify.client.get('/api/song/happy?spotify=true').json['source'] == 'local'
+        assert spotify.token_calls == 0
+    finally:
+        for _ in range(4):
+            slots.release()
+
+
+def test_jsonify_sorts_keys_and_indents_in_debug():
+    flask_app = app_module.create_app()
+    with flask_app.app_context():
+        compact = app_module.jsonify({'b': 1, 'a': {'d': 2, 'c': 3}}).get_data(as_text=True)
+        flask_app.debug = True
+        pretty = app_module.jsonify({'b': 1, 'a': 2}).get_data(as_text=True)
+
+    assert compact == '{"a":{"c":3,"d":2},"b":1}\n'
+    assert pretty == '{\n  "a": 2,\n  "b": 1\n}\n'
+
+
+@pytest.fixture
+def accel_client(monkeypatch):
+    monkeypatch.setenv('X_ACCEL_MUSIC_LOCATION', '/_music/')
+    return app_module.create_app().test_client()
+
+
+def test_accel_redirect_for_music(accel_client):
+    response = accel_client.get('/static/static_music/happy/a b(1).mp3')
+
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == '/_music/happy/a%20b%281%29.mp3'
+    assert response.mimetype == 'audio/mpeg'
+    assert response.data == b''
+
+
+def test_accel_redirect_guesses_content_type(accel_client):
+    response = accel_client.get('/static/static_music/README.txt')
+
+    assert response.headers['X-Accel-Redirect'] == '/_music/README.txt'
+    assert response.mimetype == 'text/plain'
+
+
+def test_accel_redirect_rejects_parent_paths(accel_client):
+    response = accel_client.get('/static/static_music/happy/..%2F..%2F..%2Fapp.py')
+
+    assert response.status_code == 404
+    assert 'X-Accel-Redirect' not in response.headers